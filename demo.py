@@ -1,10 +1,8 @@
 """Contains classes for mutations related to bulkchange."""
 # Library imports
-import json
 from datetime import datetime
 
 import graphene
-from admin.coc.constants import COC_CODES
 
 # Audit imports
 from audit.audit import audit
@@ -12,29 +10,24 @@ from bson.objectid import ObjectId
 from employee.exceptions import CompanySwitched
 
 # Custom imports
-from employee.models import COC, EmployeeDetails
+from employee.models import EmployeeDetails
 from employee.utils import generate_cds_employee_id, get_highest_cds_employee_id
 from flask import request
 
 # Security imports
 from flask_graphql_auth import AuthInfoField, mutation_header_jwt_required
 from leave.constants import LeaveType
+from pymongo import UpdateOne
 from security.jwt_auth import authorization, get_role_from_db, read_jwt
 from security.objects import OkFieldObj
-from tasks.change_business_group_notification import (
-    send_change_business_group_bulk_notification,
-)
-from tasks.change_dm_notification import send_change_dm_bulk_notification
-from tasks.designation_change_notification_task import (
-    employee_designation_change_bulk_notification,
-)
 
 # Celery tasks imports
-from tasks.employee_type_change_notification import (
-    employee_type_change_bulk_notification,
+from tasks.bulk_change_notification_task import send_bulk_change_notifications
+from tasks.bulk_change_task import (
+    is_designation_grade_valid,
+    run_bulk_change_task,
+    validate_general_field_input,
 )
-from tasks.grade_change_notification_task import employee_grade_change_bulk_notification
-from tasks.shift_change_notification_task import send_shift_change_bulk_notification
 from util.logger_manager import get_logger_object
 
 from .models import Leave
@@ -60,28 +53,16 @@ class BulkUnionObjects(graphene.Union):
 
 def update_all_fields_for_bulk_change(hrms_ids, general_field_input, emp_details_list, employees):
     """Update fields for the bulk changes."""
+    # Changed fields are collected and notified together
+    changes = {}
     # Send notification to employee when their employee_type is changed
-    if hrms_ids and ("employee_type" in general_field_input) and general_field_input["employee_type"]:
-        employee_type_change_bulk_notification.delay(
-            emp_details_list=emp_details_list, emp_type_code=general_field_input["employee_type"]
-        )
+    if hrms_ids and general_field_input.get("employee_type"):
+        changes["employee_type"] = general_field_input["employee_type"]
     # Insert Designation Grade History when designation and grade changed
     if "grade" in general_field_input and "designation" in general_field_input:
         # if general_field_input contains "grade" and "designation"
-        designation = COC.objects(coc_code=COC_CODES.DESIGNATION.value, code=general_field_input["designation"])
-        grade_exist = False
-        if designation:
-            # Find the grade coc using the parent value from designation coc
-            grade = COC.objects(coc_code=COC_CODES.GRADE.value, code=designation[0]["parent"])
-            if grade:
-                # Check if the grade code exist in the child of the grade coc object
-                grade_exist = any(child.code == general_field_input["grade"] for child in grade[0]["child"])
-            else:
-                logger_object.error("grade does not exist for coc code {}".format(general_field_input["grade"]))
-        else:
-            logger_object.error("designation does not exist for coc code {}".format(general_field_input["designation"]))
         # checks that grade and designation are valid or not
-        if grade_exist and designation:
+        if is_designation_grade_valid(general_field_input):
             # create a designation grade history object using given input
             insert_designation_grade_history_from_bulkchange(employees, general_field_input)
             grade_and_designation_dict = {
@@ -91,33 +72,29 @@ def update_all_fields_for_bulk_change(hrms_ids, general_field_input, emp_details
             result = employees.update(__raw__={"$set": grade_and_designation_dict})
             if result != len(hrms_ids):
                 logger_object.error(
-                    f"Error occured while updating the grade and designations. Number or records updated ({result}) does not match number of records ({len(hrms_ids)}) in dictionary"  # noqa E501
+                    "Error occured while updating the grade and designations. Number or records updated (%s) does not match number of records (%s) in dictionary",  # noqa E501
+                    result,
+                    len(hrms_ids),
                 )
+                send_bulk_change_notifications(hrms_ids, emp_details_list, changes)
                 return False
-            employee_designation_change_bulk_notification.delay(emp_details_list, general_field_input["designation"])
-            employee_grade_change_bulk_notification.delay(
-                emp_details_list, general_field_input["designation"], general_field_input["grade"]
-            )
+            changes["designation"] = general_field_input["designation"]
+            changes["grade"] = general_field_input["grade"]
     # remove the grade and designation from general_field_input because this is already
     # inserted into db
     general_field_input.pop("grade", None)
     general_field_input.pop("designation", None)
     # Send notification to employees when their shift changes
-    if hrms_ids and ("shift_type" in general_field_input) and general_field_input["shift_type"]:
-        send_shift_change_bulk_notification.delay(emp_id_list=hrms_ids, emp_shift=general_field_input["shift_type"])
+    if hrms_ids and general_field_input.get("shift_type"):
+        changes["shift_type"] = general_field_input["shift_type"]
 
     # Send notification to employees when their business group changes
-    if hrms_ids and ("business_group" in general_field_input) and general_field_input["business_group"]:
-        send_change_business_group_bulk_notification.delay(
-            emp_id_list=hrms_ids, emp_dept=general_field_input["business_group"]
-        )
+    if hrms_ids and general_field_input.get("business_group"):
+        changes["business_group"] = general_field_input["business_group"]
 
     # Send notification to employees when their direct manager changes
-    if hrms_ids and ("direct_manager" in general_field_input) and general_field_input["direct_manager"]:
-        employees.update(direct_manager=ObjectId(general_field_input["direct_manager"]))
-        send_change_dm_bulk_notification.delay(
-            emp_id_list=emp_details_list, emps_direct_manager=general_field_input["direct_manager"]
-        )
+    if hrms_ids and general_field_input.get("direct_manager"):
+        changes["direct_manager"] = general_field_input["direct_manager"]
     general_field_input.pop("direct_manager", None)
     # if Company name is updated, generate the Cds employee id
     ok = True
@@ -125,80 +102,104 @@ def update_all_fields_for_bulk_change(hrms_ids, general_field_input, emp_details
     if "saral" in general_field_input:
         # Fetch the object that has the highest Cds employee id
         current_high = get_highest_cds_employee_id(general_field_input["saral"])
-        for employee in employees:
+        cds_code_updates = []
+        # Only the fields needed to generate the cds code are fetched
+        for employee in employees.only("_id", "saral", "cds_code"):
             is_company_name_changed = employee.saral != general_field_input["saral"]
             if is_company_name_changed and employee.cds_code == "":
                 new_high = generate_cds_employee_id(current_high)
                 current_high = new_high
-                employee_obj = EmployeeDetails.objects(_id=employee._id)
-                employee_obj.update(cds_code=new_high, saral=general_field_input["saral"])
+                cds_code_updates.append((employee._id, new_high))
             elif is_company_name_changed:
-                logger_object.error("Error occurred while updating saral for {}".format(employee._id))
+                logger_object.error("Error occurred while updating saral for %s", employee._id)
                 emp_error_list.append(employee._id)
                 ok = False
+        # Update cds code and company name of all employees in a single round trip
+        if cds_code_updates:
+            EmployeeDetails._get_collection().bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": _id},
+                        {"$set": {"cds_code": cds_code, "saral": general_field_input["saral"]}},
+                    )
+                    for _id, cds_code in cds_code_updates
+                ],
+                ordered=False,
+            )
     general_field_input.pop("saral", None)
-    # check that general_field_input dictionary is not empty
-    if bool(general_field_input):
-        employees.update(__raw__={"$set": general_field_input})
+    # Remaining fields and direct manager are updated in a single query
+    pending_set = dict(general_field_input)
+    if "direct_manager" in changes:
+        pending_set["direct_manager"] = ObjectId(changes["direct_manager"])
+    # check that pending_set dictionary is not empty
+    if bool(pending_set):
+        employees.update(__raw__={"$set": pending_set})
+    send_bulk_change_notifications(hrms_ids, emp_details_list, changes)
 
     if ok:
         return True
     raise CompanySwitched("Company Name Cannot be updated for {}".format(emp_error_list))
 
 
-def update_dm_and_buissness_group_of_the_user(hrms_ids, general_field_input, emp_details_list, employees):
-    """Update direct manager and Buissness group of the user."""
-    if hrms_ids and ("direct_manager" in general_field_input) and general_field_input["direct_manager"]:
-        employees.update(__raw__={"$set": {"direct_manager": ObjectId(general_field_input["direct_manager"])}})
-        send_change_dm_bulk_notification.delay(
-            emp_id_list=emp_details_list, emps_direct_manager=general_field_input["direct_manager"]
-        )
-
-    if hrms_ids and ("business_group" in general_field_input) and general_field_input["business_group"]:
-        employees.update(__raw__={"$set": {"business_group": general_field_input["business_group"]}})
-        send_change_business_group_bulk_notification.delay(
-            emp_id_list=hrms_ids, emp_dept=general_field_input["business_group"]
-        )
-
-
-def update_leave_balance_of_the_user(leave_field_input, leave_input_value, employees):
+def update_leave_balance_of_the_user(leave_operation, leave_input_value, hrms_ids):
     """Update leave balance of the user."""
-    leave_history_obj = {
-        "date": str(datetime.now()),
-        "credit": leave_input_value if leave_field_input.operation == "ADD_TO_EXISTING" else -leave_input_value,
-    }
-    # Object to push history object and set leave balance.
-    update_queries_obj = {
-        "ADD_TO_EXISTING": {
-            "$inc": {"master_leave_balance.$.leave_balance": leave_input_value},
-            "$push": {"master_leave_balance.$.history": leave_history_obj},
-        },
-        "REMOVE_FROM_EXISTING": {
-            "$inc": {"master_leave_balance.$.leave_balance": -leave_input_value},
-            "$push": {"master_leave_balance.$.history": leave_history_obj},
-        },
-    }
+    # Object of queries
+    # ADD_TO_EXISTING:      Increment current balance by given value
+    # REMOVE_FROM_EXISTING: Decrement current balance by given value
+    # REPLACE_ALL_WITH :    Replace current balance by given value
+
+    # Get all employee objects from
+    # leave collection using hrms id's
+    # In current implementation we have only
+    # One leave type annual leave though
+    # It can be extended with different types
+    employees = Leave.objects.filter(
+        hrms_id__in=hrms_ids,
+        master_leave_balance__match={"leave_type": LeaveType.ANNUAL_LEAVE.value},
+    )
+    date = str(datetime.now())
     # If bulk change operation is replace all with
-    if leave_field_input.operation == "REPLACE_ALL_WITH":
+    if leave_operation == "REPLACE_ALL_WITH":
+        update_operations = []
         for emp in employees:
-            leave_history_obj = {
-                "date": str(datetime.now()),
-                "credit": leave_input_value
-                - float(emp["master_leave_balance"][0]["leave_balance"])
-                + float(emp["master_leave_balance"][0]["leave_taken"]),
-            }
-            emp.update(
-                __raw__={
-                    "$set": {
-                        "master_leave_balance.0.leave_balance": leave_input_value
-                        + float(emp["master_leave_balance"][0]["leave_taken"])
+            leave_balance = float(emp["master_leave_balance"][0]["leave_balance"])
+            leave_taken = float(emp["master_leave_balance"][0]["leave_taken"])
+            update_operations.append(
+                UpdateOne(
+                    {"_id": emp.pk},
+                    {
+                        "$set": {
+                            "master_leave_balance.0.leave_balance": leave_input_value + leave_taken
+                        },
+                        "$push": {
+                            "master_leave_balance.0.history": {
+                                "date": date,
+                                "credit": leave_input_value - leave_balance + leave_taken,
+                            }
+                        },
                     },
-                    "$push": {"master_leave_balance.0.history": leave_history_obj},
-                }
+                )
             )
+        # Replace leave balance of all employees in a single round trip
+        if update_operations:
+            Leave._get_collection().bulk_write(update_operations, ordered=False)
     else:
         # If bulk change operation is not replace all with.
-        employees.update(__raw__=update_queries_obj[leave_field_input.operation])
+        if leave_operation == "ADD_TO_EXISTING":
+            credit = leave_input_value
+        elif leave_operation == "REMOVE_FROM_EXISTING":
+            credit = -leave_input_value
+        else:
+            raise ValueError(
+                "Invalid leave balance bulk change operation {}".format(leave_operation)
+            )
+        # Query to push history object and set leave balance.
+        employees.update(
+            __raw__={
+                "$inc": {"master_leave_balance.$.leave_balance": credit},
+                "$push": {"master_leave_balance.$.history": {"date": date, "credit": credit}},
+            }
+        )
 
 
 def get_leave_input_value(leave_field_input):
@@ -221,8 +222,8 @@ def get_leave_input_value(leave_field_input):
         return leave_input_value
 
     except ValueError as e:
-        logger_object.error("Error occurred while converting {}".format(e))
-        logger_object.error("Not able to convert {} to Float".format(leave_field_input.value))
+        logger_object.error("Error occurred while converting %s", e)
+        logger_object.error("Not able to convert %s to Float", leave_field_input.value)
         return None
 
 
@@ -237,8 +238,8 @@ class BulkChange(graphene.Mutation):
 
         leave_field_input(object): Object contains LeaveFieldInputObj
                                    attributes
-        ok(field): True if BulkChange operation perfrom successfully otherwise
-                   false
+        ok(field): True if BulkChange operation is validated and queued successfully
+                   otherwise false, the operation is performed by run_bulk_change_task
     """
 
     class Arguments:
@@ -280,6 +281,7 @@ class BulkChange(graphene.Mutation):
             return BulkChange(ok=OkFieldObj(ok=False))
 
         # Input value for bulk leave balance change
+        leave_input_value = None
         if leave_field_input:
             leave_input_value = get_leave_input_value(leave_field_input)
             if leave_input_value is None:
@@ -287,83 +289,49 @@ class BulkChange(graphene.Mutation):
         try:
             # Get Username from JWT token
             user_name = get_user_from_jwt(request)
-            logger_object.debug("User name is {}".format(user_name))
-            logger_object.debug("Hrms id's are {}".format(hrms_ids))
-            logger_object.debug("General field input is {}".format(general_field_input))
-            logger_object.debug("Leave field input is {}".format(leave_field_input))
+            logger_object.debug("User name is %s", user_name)
+            logger_object.debug("Hrms id's are %s", hrms_ids)
+            logger_object.debug("General field input is %s", general_field_input)
+            logger_object.debug("Leave field input is %s", leave_field_input)
 
             _, hrms_id = read_jwt(request)
             user_role = get_role_from_db(hrms_id)
+            is_admin = "Admin" in user_role
+            is_pmo = "PMO" in user_role
 
-            # Get all employee objects from
-            # employeeDetailsModel collection
-            # using hrms id's
-            employees = EmployeeDetails.objects(_id__in=hrms_ids)
+            # Validate hrms id's before the bulk change is queued
+            if not all(ObjectId.is_valid(hrmsid) for hrmsid in hrms_ids if hrmsid):
+                logger_object.info("Hrms id's are not valid")
+                return BulkChange(ok=OkFieldObj(ok=False))
 
-            # The API is accessible by PMO and Admin only.
-            # so the condition will check whether the role
-            # is Admin or PMO.
-            # If general field input in present
-            # condition will be True
+            # Every hrms id of the general field change must belong to an employee
             if general_field_input:
-                # HRMS-2784 - get prev DM details of all employees
-                # cannot go inside if loop as the DB is getting
-                # updated before fetching prev dm details
-                emp_details_list = []
-                for hrmsid in hrms_ids:
-                    if hrmsid:
-                        emp_details = {}
-                        employee = json.loads(EmployeeDetails.objects(_id=hrmsid).to_json())[0]
-                        emp_details["hrms_id"] = hrmsid
-                        emp_details["emp_code"] = employee["emp_code"]
-                        emp_details["first_name"] = employee["first_name"]
-                        emp_details["email"] = employee["email"]
-                        emp_details["prev_dm"] = employee.get("direct_manager", "")
-                        emp_details["old_designation"] = employee["designation"]
-                        emp_details["old_grade"] = employee["grade"]
-                        emp_details["saral"] = employee.get("saral", "")
-                        emp_details["old_emp_type"] = employee["employee_type"]
-                        emp_details_list.append(emp_details)
-                # If role is Admin,
-                # function will allow him/her
-                # to update all fields.
-                if "Admin" in user_role:
-                    ok = update_all_fields_for_bulk_change(hrms_ids, general_field_input, emp_details_list, employees)
-                    if not ok:
-                        return BulkChange(ok=OkFieldObj(ok=False))
-
-                # If role is not Admin it will be PMO,
-                # so, PMO is allowed to update only direct manager and buissness group of the user
-                if "PMO" in user_role and "Admin" not in user_role:
-                    update_dm_and_buissness_group_of_the_user(
-                        hrms_ids, general_field_input, emp_details_list, employees
-                    )
-
-            # Object of queries
-            # ADD_TO_EXISTING:      Increment current balance by given value
-            # REMOVE_FROM_EXISTING: Decrement current balance by given value
-            # REPLACE_ALL_WITH :    Replace current balance by given value
-
-            # Get all employee objects from
-            # leave collection using hrms id's
-            # In current implementation we have only
-            # One leave type annual leave though
-            # It can be extended with different types
-            employees = Leave.objects.filter(
-                hrms_id__in=hrms_ids,
-                master_leave_balance__match={"leave_type": LeaveType.ANNUAL_LEAVE.value},
+                employee_ids = {ObjectId(hrmsid) for hrmsid in hrms_ids if hrmsid}
+                if EmployeeDetails.objects(_id__in=list(employee_ids)).count() != len(employee_ids):
+                    logger_object.info("Employees do not exist for all hrms id's %s", hrms_ids)
+                    return BulkChange(ok=OkFieldObj(ok=False))
+
+            # Checks on which Admin bulk change fails are done before it is queued
+            if is_admin and general_field_input:
+                if not validate_general_field_input(hrms_ids, general_field_input):
+                    return BulkChange(ok=OkFieldObj(ok=False))
+
+            # Bulk change is applied by celery worker so that
+            # request is not blocked by the database updates
+            run_bulk_change_task.delay(
+                __name__,
+                is_admin,
+                is_pmo,
+                hrms_ids,
+                dict(general_field_input) if general_field_input else None,
+                leave_field_input.operation if leave_field_input else None,
+                leave_input_value,
             )
 
-            # If user wants to update Leave Balance
-            # condition will be True
-            if leave_field_input and ("Admin" in user_role or "PMO" in user_role):
-                update_leave_balance_of_the_user(leave_field_input, leave_input_value, employees)
-
         except CompanySwitched:
-            ok = False
             raise
         except Exception as e:
-            logger_object.error("Exception occurred while bulk changing {}".format(e))
+            logger_object.error("Exception occurred while bulk changing %s", e)
             return BulkChange(ok=OkFieldObj(ok=False))
 
         return BulkChange(ok=OkFieldObj(ok=True))
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""Contains function to send all notification tasks of a bulk change."""
+from celery import group
+from tasks.change_business_group_notification import (
+    send_change_business_group_bulk_notification,
+)
+from tasks.change_dm_notification import send_change_dm_bulk_notification
+from tasks.designation_change_notification_task import (
+    employee_designation_change_bulk_notification,
+)
+from tasks.employee_type_change_notification import (
+    employee_type_change_bulk_notification,
+)
+from tasks.grade_change_notification_task import employee_grade_change_bulk_notification
+from tasks.shift_change_notification_task import send_shift_change_bulk_notification
+
+
+def send_bulk_change_notifications(hrms_ids, emp_details_list, changes):
+    """Send notifications for every field changed by a bulk change.
+
+    It is called by run_bulk_change_task in the worker, the notification tasks
+    are applied as a group so each of them runs, retries and fails independently.
+
+    Args:
+        hrms_ids (list): Hrms id's of the employees which are bulk changed.
+        emp_details_list (list): Details of the employees before bulk change.
+        changes (dict): Changed fields with their new values. Supported keys are
+                        employee_type, designation, grade, shift_type,
+                        business_group and direct_manager.
+    """
+    notifications = []
+    if changes.get("employee_type"):
+        notifications.append(
+            employee_type_change_bulk_notification.s(
+                emp_details_list=emp_details_list, emp_type_code=changes["employee_type"]
+            )
+        )
+    if changes.get("designation") and changes.get("grade"):
+        notifications.append(
+            employee_designation_change_bulk_notification.s(
+                emp_details_list, changes["designation"]
+            )
+        )
+        notifications.append(
+            employee_grade_change_bulk_notification.s(
+                emp_details_list, changes["designation"], changes["grade"]
+            )
+        )
+    if changes.get("shift_type"):
+        notifications.append(
+            send_shift_change_bulk_notification.s(
+                emp_id_list=hrms_ids, emp_shift=changes["shift_type"]
+            )
+        )
+    if changes.get("business_group"):
+        notifications.append(
+            send_change_business_group_bulk_notification.s(
+                emp_id_list=hrms_ids, emp_dept=changes["business_group"]
+            )
+        )
+    if changes.get("direct_manager"):
+        notifications.append(
+            send_change_dm_bulk_notification.s(
+                emp_id_list=emp_details_list, emps_direct_manager=changes["direct_manager"]
+            )
+        )
+
+    if notifications:
+        group(notifications).apply_async()
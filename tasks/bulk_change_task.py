@@ -0,0 +1,313 @@
+"""Contains celery task to apply bulk change of employees."""
+from importlib import import_module
+from threading import Lock
+
+from admin.coc.constants import COC_CODES
+from bson.objectid import ObjectId
+from cachetools import TTLCache
+from celery import shared_task
+from employee.exceptions import CompanySwitched
+from employee.models import COC, EmployeeDetails
+from tasks.bulk_change_notification_task import send_bulk_change_notifications
+from util.logger_manager import get_logger_object
+
+logger_object = get_logger_object()
+
+
+# Projection of EmployeeDetails to the previous details
+# required to notify employees about bulk changes.
+# It is not reduced per changed field because one emp_details_list is shared
+# by all notifications of a bulk change and each notification task may read
+# any of these keys, so every bulk change which needs the details gets all of them
+EMP_DETAILS_PROJECTION = {
+    "emp_code": 1,
+    "first_name": 1,
+    "email": 1,
+    "prev_dm": {"$ifNull": ["$direct_manager", ""]},
+    "old_designation": "$designation",
+    "old_grade": "$grade",
+    "saral": {"$ifNull": ["$saral", ""]},
+    "old_emp_type": "$employee_type",
+}
+
+# Seconds for which designation and grade coc are cached
+COC_CACHE_TTL = 300
+# Designation code -> designation coc with its grade coc,
+# TTLCache is not thread safe so it is accessed under the lock
+designation_grade_cache = TTLCache(maxsize=1024, ttl=COC_CACHE_TTL)
+designation_grade_cache_lock = Lock()
+
+
+def get_designation_with_grade(designation_code):
+    """Get designation coc along with its parent grade coc in a single query.
+
+    COC is reference data which is rarely edited, so the result is cached in
+    the process for COC_CACHE_TTL seconds.
+
+    Args:
+        designation_code (str): Code of the designation coc.
+
+    Returns:
+        dict: Designation coc, its parent grade coc is in "grade_doc" list
+              and the child codes of the grade coc are in "grade_codes" set.
+        None: If designation coc does not exist.
+    """
+    with designation_grade_cache_lock:
+        designation = designation_grade_cache.get(designation_code)
+    if designation:
+        return designation
+    pipeline = [
+        {"$match": {"coc_code": COC_CODES.DESIGNATION.value, "code": designation_code}},
+        {"$limit": 1},
+        {
+            "$lookup": {
+                "from": COC._get_collection_name(),
+                "let": {"parent": "$parent"},
+                "pipeline": [
+                    {
+                        "$match": {
+                            "$expr": {
+                                "$and": [
+                                    {"$eq": ["$coc_code", COC_CODES.GRADE.value]},
+                                    {"$eq": ["$code", "$$parent"]},
+                                ]
+                            }
+                        }
+                    }
+                ],
+                "as": "grade_doc",
+            }
+        },
+    ]
+    designation = next(COC._get_collection().aggregate(pipeline), None)
+    if designation:
+        grade = designation["grade_doc"]
+        designation["grade_codes"] = set()
+        if grade:
+            designation["grade_codes"] = {child["code"] for child in grade[0].get("child", [])}
+        with designation_grade_cache_lock:
+            designation_grade_cache[designation_code] = designation
+    return designation
+
+
+def is_designation_grade_valid(general_field_input):
+    """Check that designation and grade of the bulk change exist in coc.
+
+    Args:
+        general_field_input (dict): General field related bulk change data
+                                    containing "designation" and "grade".
+
+    Returns:
+        bool: True if grade is a child of the parent grade coc of the designation.
+    """
+    designation = get_designation_with_grade(general_field_input["designation"])
+    if not designation:
+        logger_object.error(
+            "designation does not exist for coc code %s", general_field_input["designation"]
+        )
+        return False
+    # Grade coc found using the parent value from designation coc
+    if not designation["grade_doc"]:
+        logger_object.error("grade does not exist for coc code %s", general_field_input["grade"])
+        return False
+    # Check if the grade code exist in the child of the grade coc object
+    return general_field_input["grade"] in designation["grade_codes"]
+
+
+def validate_general_field_input(hrms_ids, general_field_input):
+    """Validate bulk change of Admin before it is queued.
+
+    Runs the checks on which update_all_fields_for_bulk_change fails, so the
+    failure is returned to the user instead of only being logged by the worker.
+    A failed check rejects the whole bulk change and nothing is written.
+    Earlier these failures happened after grade, designation and its history
+    were already written, and for company switch also the other fields and
+    the eligible cds codes.
+
+    Args:
+        hrms_ids (list): All hrms id's on which operation to be performed.
+        general_field_input (dict): General field related bulk change data.
+
+    Returns:
+        bool: False if grade and designation cannot be updated for all hrms id's.
+
+    Raises:
+        CompanySwitched: If company name of employees having cds code is changed.
+    """
+    employee_ids = [ObjectId(hrmsid) for hrmsid in hrms_ids if hrmsid]
+    employees = EmployeeDetails.objects(_id__in=employee_ids)
+    if (
+        "grade" in general_field_input
+        and "designation" in general_field_input
+        and is_designation_grade_valid(general_field_input)
+        and employees.count() != len(hrms_ids)
+    ):
+        logger_object.error(
+            "Grade and designation cannot be updated for all hrms id's %s", hrms_ids
+        )
+        return False
+    if "saral" in general_field_input:
+        # Cds code is generated only for employees which do not have it
+        emp_error_list = list(
+            employees.filter(saral__ne=general_field_input["saral"], cds_code__ne="").scalar("_id")
+        )
+        if emp_error_list:
+            logger_object.error("Error occurred while updating saral for %s", emp_error_list)
+            raise CompanySwitched("Company Name Cannot be updated for {}".format(emp_error_list))
+    return True
+
+
+def update_dm_and_buissness_group_of_the_user(
+    hrms_ids, general_field_input, emp_details_list, employees
+):
+    """Update direct manager and Buissness group of the user."""
+    changes = {}
+    pending_set = {}
+    if hrms_ids and general_field_input.get("direct_manager"):
+        pending_set["direct_manager"] = ObjectId(general_field_input["direct_manager"])
+        changes["direct_manager"] = general_field_input["direct_manager"]
+
+    if hrms_ids and general_field_input.get("business_group"):
+        pending_set["business_group"] = general_field_input["business_group"]
+        changes["business_group"] = general_field_input["business_group"]
+
+    # Direct manager and business group are updated in a single query
+    if pending_set:
+        employees.update(__raw__={"$set": pending_set})
+    send_bulk_change_notifications(hrms_ids, emp_details_list, changes)
+
+
+def is_emp_details_required(general_field_input, is_admin):
+    """Check if previous details of employees are needed to notify the bulk change.
+
+    Shift and business group notifications only need hrms id's, so the details
+    are needed only for employee type, designation, grade and direct manager.
+
+    Args:
+        general_field_input (dict): General field related bulk change data.
+        is_admin (bool): True if the user is Admin, PMO can change only
+                         direct manager and business group.
+
+    Returns:
+        bool: True if emp_details_list has to be built.
+    """
+    if general_field_input.get("direct_manager"):
+        return True
+    if is_admin:
+        return bool(general_field_input.get("employee_type")) or (
+            "grade" in general_field_input and "designation" in general_field_input
+        )
+    return False
+
+
+def get_emp_details_list(hrms_ids, employee_ids):
+    """Get details of the employees before bulk change is applied.
+
+    Args:
+        hrms_ids (list): Hrms id's of the employees in order of bulk change input.
+        employee_ids (list): ObjectIds of the hrms id's.
+
+    Returns:
+        list: Previous details of the employees used by bulk change notifications.
+    """
+    pipeline = [
+        {"$match": {"_id": {"$in": employee_ids}}},
+        {"$project": EMP_DETAILS_PROJECTION},
+    ]
+    employee_by_id = {
+        str(employee.pop("_id")): employee
+        for employee in EmployeeDetails._get_collection().aggregate(pipeline)
+    }
+    emp_details_list = []
+    for hrmsid in hrms_ids:
+        if hrmsid:
+            employee = employee_by_id.get(str(ObjectId(hrmsid)))
+            if employee is None:
+                # Employee is removed after the bulk change is queued
+                logger_object.error("Employee does not exist for hrms id %s", hrmsid)
+                continue
+            emp_details = dict(employee, hrms_id=hrmsid)
+            if isinstance(emp_details["prev_dm"], ObjectId):
+                # Keep the extended JSON format which was sent to notification tasks
+                emp_details["prev_dm"] = {"$oid": str(emp_details["prev_dm"])}
+            emp_details_list.append(emp_details)
+    return emp_details_list
+
+
+@shared_task
+def run_bulk_change_task(
+    bulk_change_module,
+    is_admin,
+    is_pmo,
+    hrms_ids,
+    general_field_input,
+    leave_operation,
+    leave_input_value,
+):
+    """Apply bulk change of general fields and leave balance of the employees.
+
+    Args:
+        bulk_change_module (str): Dotted path of the bulk change mutation module,
+                                  its update helpers use the models of that package.
+        is_admin (bool): True if the user who requested the bulk change is Admin.
+        is_pmo (bool): True if the user who requested the bulk change is PMO.
+        hrms_ids (list): All hrms id's on which operation to be performed.
+        general_field_input (dict): It contains general field related bulk change data.
+        leave_operation (str): Operation of leave balance bulk change.
+        leave_input_value (float): Input value for bulk leave balance change.
+
+    Returns:
+        bool: True if bulk change is applied successfully otherwise False.
+    """
+    try:
+        # Imported when the task runs because the mutation module imports this task
+        bulk_change = import_module(bulk_change_module)
+
+        # Get all employee objects from
+        # employeeDetailsModel collection
+        # using hrms id's converted once to ObjectIds
+        employee_ids = [ObjectId(hrmsid) for hrmsid in hrms_ids if hrmsid]
+        employees = EmployeeDetails.objects(_id__in=employee_ids)
+
+        # The API is accessible by PMO and Admin only.
+        # so the condition will check whether the role
+        # is Admin or PMO.
+        # If general field input in present
+        # condition will be True
+        if general_field_input:
+            # HRMS-2784 - get prev DM details of all employees
+            # cannot go inside if loop as the DB is getting
+            # updated before fetching prev dm details
+            emp_details_list = []
+            if is_emp_details_required(general_field_input, is_admin):
+                # Fetch all employees in a single query instead of one per hrms id
+                emp_details_list = get_emp_details_list(hrms_ids, employee_ids)
+            # If role is Admin,
+            # function will allow him/her
+            # to update all fields.
+            if is_admin:
+                ok = bulk_change.update_all_fields_for_bulk_change(
+                    hrms_ids, general_field_input, emp_details_list, employees
+                )
+                if not ok:
+                    return False
+
+            # If role is not Admin it will be PMO,
+            # so, PMO is allowed to update only direct manager and buissness group of the user
+            if is_pmo and not is_admin:
+                update_dm_and_buissness_group_of_the_user(
+                    hrms_ids, general_field_input, emp_details_list, employees
+                )
+
+        # If user wants to update Leave Balance
+        # condition will be True
+        if leave_operation and (is_admin or is_pmo):
+            bulk_change.update_leave_balance_of_the_user(
+                leave_operation, leave_input_value, hrms_ids
+            )
+
+    except Exception as e:
+        logger_object.error("Exception occurred while bulk changing %s", e)
+        return False
+
+    return True